@@ -0,0 +1,48 @@
+// src/components/LinkHealthPanel.tsx
+import { useTelemetryData } from "../context/TelemetryContext";
+import { BarGauge } from "./BarGauge";
+
+export const LinkHealthPanel = () => {
+  const { linkHealth } = useTelemetryData();
+
+  if (!linkHealth) return (
+    <div className="waiting-text">No radio link (serial source only)</div>
+  );
+
+  return (
+    <div className="live-data-container">
+      <div className="data-grid">
+        <div className="data-box">
+          <span className="data-label">Throughput</span>
+          <span className="data-value" style={{color: 'var(--accent-cyan)'}}>
+            {(linkHealth.throughput_bps / 1000).toFixed(2)}<span className="data-unit">kbit/s</span>
+          </span>
+        </div>
+        <div className="data-box">
+          <span className="data-label">Packets</span>
+          <span className="data-value" style={{color: 'var(--accent-green)'}}>
+            {linkHealth.packets_per_s.toFixed(1)}<span className="data-unit">/s</span>
+          </span>
+        </div>
+        <div className="data-box">
+          <span className="data-label">Jitter</span>
+          <span className="data-value">
+            {linkHealth.jitter_ms.toFixed(0)}<span className="data-unit">ms</span>
+          </span>
+        </div>
+        <div className="data-box">
+          <span className="data-label">Last Frame</span>
+          <span className="data-value">
+            {linkHealth.last_frame_age_ms === null ? "--" : (linkHealth.last_frame_age_ms / 1000).toFixed(1)}
+            <span className="data-unit">s ago</span>
+          </span>
+        </div>
+      </div>
+
+      <div style={{ display: 'flex', flexDirection: 'column', gap: '8px', padding: '0 5px' }}>
+          <BarGauge label="PKT LOSS" value={linkHealth.packet_loss_pct} max={100} warning_value={5} critical_value={20} unit="%" />
+          <BarGauge label="CRC ERR" value={linkHealth.crc_error_pct} max={100} warning_value={2} critical_value={10} unit="%" />
+      </div>
+    </div>
+  );
+};
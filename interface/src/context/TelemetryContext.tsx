@@ -1,6 +1,6 @@
 import { createContext, useContext } from "react";
 import type { ReactNode } from "react";
-import type { TelemetriaData } from "../types/TelemetriaData";
+import type { LinkHealth, TelemetriaData } from "../types/TelemetriaData";
 
 // The context must hold all displayed data
 interface TelemetryContextType {
@@ -35,6 +35,7 @@ interface TelemetryContextType {
     };
     connectedIp: string | null;
     startFinishLine?: { lat: number; lon: number } | null;
+    linkHealth?: LinkHealth | null;
 }
 
 const TelemetryContext = createContext<TelemetryContextType | null>(null);
@@ -54,7 +55,8 @@ export function useTelemetryData() {
                 latitude: [], longitude: [], path: []
             },
             connectedIp: null,
-            startFinishLine: null
+            startFinishLine: null,
+            linkHealth: null
         };
     }
     return context;
@@ -0,0 +1,36 @@
+// src/hooks/useLinkHealth.ts
+import { useEffect, useState } from "react";
+import type { LinkHealth } from "../types/TelemetriaData";
+
+// Radio link health, sent by the server about once a second on its own socket
+export function useLinkHealth(serverIp: string | null) {
+    const [health, setHealth] = useState<LinkHealth | null>(null);
+
+    useEffect(() => {
+        if (!serverIp) {
+            setHealth(null);
+            return;
+        }
+
+        const ws = new WebSocket(`ws://${serverIp}:8000/ws/link`);
+
+        ws.onmessage = (event) => {
+            try {
+                setHealth(JSON.parse(event.data));
+            } catch (e) {
+                console.error("Failed to parse link health message:", e);
+            }
+        };
+
+        ws.onclose = () => {
+            setHealth(null);
+        };
+
+        return () => {
+            ws.close();
+        };
+
+    }, [serverIp]);
+
+    return health;
+}
@@ -7,12 +7,14 @@ import "dockview/dist/styles/dockview.css";
 import "./style.css";
 
 import { useTelemetry } from "../hooks/useTelemetry";
+import { useLinkHealth } from "../hooks/useLinkHealth";
 import { ChartPanel } from "../components/ChartPanel";
 import { TelemetryProvider, useTelemetryData } from "../context/TelemetryContext";
 import type { TelemetriaData } from "../types/TelemetriaData";
 import { Mapa } from "../components/Mapa";
 import { CarModel } from "../components/CarModel";
 import { LiveCarPanel } from "../components/LiveCarPanel";
+import { LinkHealthPanel } from "../components/LinkHealthPanel";
 import { GGDiagram } from "../components/CGDiagram";
 
 // Definitions for available channels and colors
@@ -135,6 +137,7 @@ const components = {
     chart_panel: (props: IDockviewPanelProps) => <ChartPanel {...props} />,
     carTilt_panel: (_props: IDockviewPanelProps) => <CarTilt />,
     gg_panel: (_props: IDockviewPanelProps) => <GGDiagram />,
+    link_panel: (_props: IDockviewPanelProps) => <LinkHealthPanel />,
 };
 
 // Layout setup
@@ -203,6 +206,14 @@ function loadDefaultLayout(api: DockviewApi) {
         title: 'G-G Diagram',
         position: { referencePanel: 'car_panel', direction: 'below' }
     });
+
+    // Packet loss, CRC errors, throughput of the radio
+    api.addPanel({
+        id: 'link_panel',
+        component: 'link_panel',
+        title: 'Link Health',
+        position: { referencePanel: 'gg_panel', direction: 'within' }
+    });
 }
 
 const Dashboard = () => {
@@ -219,6 +230,7 @@ const Dashboard = () => {
 
     // Data received from the backend
     const incomingData = useTelemetry(serverIp || null);
+    const linkHealth = useLinkHealth(serverIp || null);
 
     // Data context
     const [contextState, setContextState] = useState({
@@ -537,7 +549,7 @@ const Dashboard = () => {
             </div>
 
             <div style={{ flexGrow: 1, overflow: 'hidden' }}>
-                <TelemetryProvider value={{ ...contextState, startFinishLine: activeSF }}>
+                <TelemetryProvider value={{ ...contextState, startFinishLine: activeSF, linkHealth }}>
                     <DockviewReact components={components} onReady={onReady} className="dockview-theme-dark" />
                 </TelemetryProvider>
             </div>
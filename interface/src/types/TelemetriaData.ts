@@ -33,4 +33,21 @@ export type TelemetriaData = {
     
     total_distance?: number;
     lap_distance?: number;
+    lap_delta?: number | null;
+    reference_lap?: number | null;
+};
+
+// Radio link health (serial/LoRa source only), sent on /ws/link on its own timer
+export type LinkHealth = {
+    packet_loss_pct: number;
+    crc_error_pct: number;
+    jitter_ms: number;
+    interval_ms: number;
+    packets_per_s: number;
+    throughput_bps: number;
+    received: number;
+    lost: number;
+    pending_lost: number;
+    crc_errors: number;
+    last_frame_age_ms: number | null;
 };
@@ -1,18 +1,38 @@
-import asyncio
-import json
-import logging
-from contextlib import asynccontextmanager
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.middleware.cors import CORSMiddleware
-
-from settings import settings
-from services.parser import DataParser
-from services.database import DatabaseService
-from services.data_processing import DataProcessing
-from telemetry.LoRa import SerialTelemetry
-from telemetry.MQTT import MqttProtocol
-from simuladores.python.simulador import Simulador
+import time
+_startup_t0 = time.perf_counter() # Startup timing starts before the heavy imports
+from contextlib import asynccontextmanager, contextmanager
+
+# Startup phases and their duration in ms, logged once the server is ready
+startup_phases = {}
+
+@contextmanager
+def startup_phase(name: str):
+    start = time.perf_counter()
+    yield
+    startup_phases[name] = (time.perf_counter() - start) * 1000
+
+with startup_phase("stdlib imports"):
+    import asyncio
+    import json
+    import logging
+    from typing import Any, Dict
+
+with startup_phase("fastapi import"):
+    from fastapi import FastAPI, Query, WebSocket, WebSocketDisconnect
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import StreamingResponse
+
+with startup_phase("settings"):
+    from settings import settings
+
+with startup_phase("service imports"):
+    from services.parser import DataParser
+    from services.data_processing import DataProcessing
+    from services.analytics import AnalyticsService
+    from services.export import EXPORT_FORMATS, export_session
+    from services.storage import DATA_CHANNELS
+# Telemetry sources and storage backends are imported when selected,
+# so the ones that aren't used (aiomqtt, ssl, serial...) never load
 
 # Setting up components
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -40,11 +60,37 @@ class ConnectionManager:
             return
         await asyncio.gather(*[connection.send_text(message) for connection in self.active_connections])
 
+def get_storage_backend():
+    """ Gets the selected storage backend """
+    backend = settings.storage_backend
+    if backend == "sqlite":
+        from services.database import DatabaseService
+        return DatabaseService(db_path=settings.database_path)
+    elif backend == "influxdb":
+        from services.influx import InfluxLineProtocolBackend
+        return InfluxLineProtocolBackend(url=settings.influx_url,
+                                         token=settings.influx_token,
+                                         org=settings.influx_org,
+                                         bucket=settings.influx_bucket,
+                                         batch_size=settings.influx_batch_size,
+                                         flush_interval_seconds=settings.influx_flush_interval_seconds,
+                                         max_retries=settings.influx_max_retries,
+                                         spill_path=settings.influx_spill_path)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+
 # Building services
 manager = ConnectionManager() # The connection manager takes care of each client
+link_manager = ConnectionManager() # Clients of the radio link health, kept apart from the telemetry stream
 parser = DataParser(payload_fmt=settings.serial_packet_format) # Parses raw serial received data
-db_service = DatabaseService(db_path=settings.database_path) # DB interface
-data_processing = DataProcessing() # Responsable for processing any data required by the front end
+with startup_phase(f"storage backend ({settings.storage_backend})"):
+    db_service = get_storage_backend() # SQLite or InfluxDB storage
+with startup_phase("data processing"):
+    data_processing = DataProcessing() # Responsable for processing any data required by the front end
+with startup_phase("analytics service"):
+    analytics_service = AnalyticsService(reader_config=db_service.reader_config(),
+                                         workers=settings.analytics_workers,
+                                         cache_size=settings.analytics_cache_size) # Heavy analysis, off the event loop
 telemetry_service = None # SerialTelemetry, MqttProtocol or Simulador
 
 # Helper for history
@@ -55,15 +101,21 @@ def get_telemetry_service():
     """ Gets the selected telemetry service """
     source = settings.data_source
     if source == "serial":
+        from telemetry.LoRa import SerialTelemetry
         return SerialTelemetry(port=settings.serial_port,
                                baudrate=settings.serial_baudrate,
-                               packet_format=settings.serial_packet_format)
+                               packet_format=settings.serial_packet_format,
+                               sequence_numbers=settings.serial_sequence_numbers,
+                               crc16=settings.serial_crc16,
+                               link_window_seconds=settings.link_window_seconds)
     elif source == "mqtt":
+        from telemetry.MQTT import MqttProtocol
         return MqttProtocol(hostname=settings.mqtt_hostname,
                                port=settings.mqtt_port,
                                username=settings.mqtt_username,
                                password=settings.mqtt_password)
     elif source == "simulator":
+        from simuladores.python.simulador import Simulador
         return Simulador()
     else:
         raise ValueError(f"Unknown data source: {source}")
@@ -71,23 +123,36 @@ def get_telemetry_service():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global telemetry_service
-    telemetry_service = get_telemetry_service()
+    with startup_phase(f"telemetry source ({settings.data_source})"):
+        telemetry_service = get_telemetry_service()
     broadcast_task = None
 
     if settings.data_source != "simulator":
-        await telemetry_service.start()
-        db_service.connect()
-        db_service.create_schema()
-        db_service.start_new_session(label=f"Sessão: {settings.data_source.upper()}")
+        with startup_phase(f"source start ({settings.data_source})"):
+            await telemetry_service.start()
+        with startup_phase(f"storage ({settings.storage_backend})"):
+            db_service.connect()
+            db_service.create_schema()
+            db_service.start_new_session(label=f"Sessão: {settings.data_source.upper()}")
 
     broadcast_task = asyncio.create_task(broadcast_telemetry())
+    # Link health of the radio, for sources that account it
+    link_quality = getattr(telemetry_service, "link_quality", None)
+    link_task = asyncio.create_task(broadcast_link_health(link_quality)) if link_quality is not None else None
+
+    total = (time.perf_counter() - _startup_t0) * 1000
+    phases = ", ".join(f"{name}: {ms:.1f} ms" for name, ms in startup_phases.items())
+    logger.info(f"[Startup] Ready in {total:.1f} ms ({phases})")
 
     yield
 
     if broadcast_task:
         broadcast_task.cancel()
+    if link_task:
+        link_task.cancel()
     if settings.data_source != "simulator":
         await telemetry_service.stop()
+    analytics_service.shutdown()
     db_service.close()
 
 app = FastAPI(lifespan=lifespan)
@@ -140,6 +205,21 @@ async def broadcast_telemetry():
 
         await asyncio.sleep(settings.broadcast_delay_seconds)
 
+async def broadcast_link_health(link_quality):
+    """
+    Sends the radio link health on its own timer, so the clients still get
+    it (and see the loss growing) when no packet arrives.
+    It has its own socket, telemetry clients read every message as a packet.
+    """
+    while True:
+        try:
+            await asyncio.sleep(settings.link_broadcast_interval_seconds)
+            await link_manager.broadcast(json.dumps(link_quality.snapshot()))
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Link Health Broadcast Error: {e}")
+
 @app.websocket("/ws/telemetry")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
@@ -149,6 +229,15 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+@app.websocket("/ws/link")
+async def link_websocket_endpoint(websocket: WebSocket):
+    await link_manager.connect(websocket)
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        link_manager.disconnect(websocket)
+
 # Endpoint to set S/F Line
 # This is essential for the lap counter
 @app.post("/api/set-sf")
@@ -162,6 +251,13 @@ async def set_start_finish():
             return {"status": "ok", "location": {"lat": lat, "lon": lon}}
     return {"status": "error", "message": "No GPS data available"}
 
+# Chooses the lap the live delta is computed against
+@app.post("/api/reference-lap")
+async def set_reference_lap(lap: int | None = None):
+    if not data_processing.set_reference_lap(lap):
+        return {"status": "error", "message": f"Lap {lap} was not recorded"}
+    return {"status": "ok", "reference": lap if lap is not None else "best"}
+
 @app.get("/api/session/history")
 async def get_history():
     """
@@ -170,3 +266,120 @@ async def get_history():
     """
     # Return the global buffer (last 500 points)
     return history_buffer
+
+@app.get("/api/storage/status")
+async def get_storage_status():
+    """ Storage health, e.g. InfluxDB batches spilled to disk or rejected """
+    return {"status": "ok", **db_service.status()}
+
+@app.get("/api/sessions/{session_id}/telemetry")
+async def get_session_telemetry(session_id: int,
+                                start: int | None = None,
+                                end: int | None = None,
+                                resolution_ms: float | None = None,
+                                max_points: int = 2000,
+                                channels: str | None = None):
+    """
+    Returns a time range of a stored session.
+    The coarsest rollup level that still meets the requested resolution is
+    used, so overview charts of a whole race only read the pre-aggregated
+    buckets. Without resolution_ms it is derived from max_points, which
+    also caps the number of points: a finer answer is served from the
+    finest rollup level that fits instead of being cut short.
+    start/end are in the backend's time base: the ECU counter (ms) on SQLite,
+    Unix ms of the server receive time on InfluxDB, where each point also
+    carries the ECU counter as ecu_timestamp.
+    """
+    if not db_service.is_connected:
+        return {"status": "error", "message": "Database not connected"}
+    channel_list = channels.split(",") if channels else None
+
+    def read(start, end, resolution_ms):
+        if start is None or end is None:
+            span = db_service.get_session_span(session_id)
+            if span is None:
+                return 0, []
+            start = span[0] if start is None else start
+            end = span[1] if end is None else end
+
+        if resolution_ms is None:
+            resolution_ms = (end - start) / max(max_points, 1)
+        return db_service.query_telemetry(session_id, start, end, resolution_ms,
+                                          channel_list, max_points=max_points)
+
+    # Storage reads block, keep them away from the live broadcast
+    level, points = await asyncio.to_thread(read, start, end, resolution_ms)
+    return {"status": "ok", "resolution_ms": level, "points": points}
+
+@app.post("/api/sessions/{session_id}/analytics/{kind}")
+async def start_analysis(session_id: int, kind: str, params: Dict[str, Any] | None = None):
+    """
+    Queues an analysis of a stored session: gg, histogram, laps or track-map.
+    Runs in the analytics process pool, poll the returned job for the result.
+    """
+    params = dict(params or {})
+    if kind == "laps" and data_processing.sf_line and "sf_lat" not in params:
+        params["sf_lat"], params["sf_lon"] = data_processing.sf_line
+
+    # The live session keeps growing, its results can't be reused
+    use_cache = session_id != db_service.session_id
+    try:
+        # Starting the pool spawns processes, keep it off the event loop
+        job = await asyncio.to_thread(analytics_service.submit, kind, session_id, params, use_cache)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "ok", **analytics_service.get(job.id)}
+
+@app.get("/api/analytics/jobs/{job_id}")
+async def get_analysis(job_id: str):
+    job = analytics_service.get(job_id)
+    if job is None:
+        return {"status": "error", "message": "Unknown job"}
+    return {"status": "ok", **job}
+
+@app.delete("/api/analytics/jobs/{job_id}")
+async def cancel_analysis(job_id: str):
+    if not analytics_service.cancel(job_id):
+        return {"status": "error", "message": "Job not found or already finished"}
+    return {"status": "ok", "job_id": job_id}
+
+@app.get("/api/sessions/{session_id}/export")
+async def export_session_data(session_id: int,
+                              format: str = "csv",
+                              channels: str | None = None,
+                              start: int | None = Query(None, alias="from"),
+                              end: int | None = Query(None, alias="to"),
+                              gzip: bool = False):
+    """
+    Streams a stored session as CSV or NDJSON.
+    Rows are read in chunks from their own read-only cursor on a worker
+    thread, so memory stays constant and the live ingest keeps running.
+    from/to are in the backend's time base: the ECU counter (ms) on SQLite,
+    Unix ms of the server receive time on InfluxDB, which also exports the
+    ECU counter as an ecu_timestamp column.
+    """
+    if format not in EXPORT_FORMATS:
+        return {"status": "error", "message": f"Unknown format: {format}"}
+
+    channel_list = [c for c in channels.split(",") if c in DATA_CHANNELS] if channels else list(DATA_CHANNELS)
+    channel_list = [*db_service.time_channels, *channel_list]
+    rows = db_service.iter_session(session_id, channel_list, start, end)
+
+    # Read the first row up front so a missing database is reported as an error
+    try:
+        first = await asyncio.to_thread(next, rows, None)
+    except Exception as e:
+        return {"status": "error", "message": f"Export failed: {e}"}
+
+    def all_rows():
+        if first is not None:
+            yield first
+            yield from rows
+
+    filename = f"session_{session_id}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        # A sync iterator, Starlette runs it in the threadpool
+        export_session(all_rows(), channel_list, format, compress=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
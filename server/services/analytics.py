@@ -0,0 +1,396 @@
+"""
+    Heavy per-session analytics.
+
+    Jobs run in a process pool so a long computation over a whole session
+    never shares the event loop (or the GIL) with the live broadcast.
+    Results are cached by session id and parameters with LRU eviction.
+    The analyses take the rows as an iterator straight from the storage
+    cursor, so a worker never holds a whole session in memory.
+"""
+
+import bisect
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from services.data_processing import DataProcessing
+from services.storage import DATA_CHANNELS
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    pass
+
+class _Progress:
+    """
+    Reports progress back to the server process and checks for cancellation.
+    Calls are throttled since every access to the shared dicts is an IPC call.
+    """
+    interval_seconds = 0.2
+
+    def __init__(self, job_id: str, progress, cancelled):
+        self.job_id = job_id
+        self.progress = progress
+        self.cancelled = cancelled
+        self._last = 0.0
+
+    def __call__(self, fraction: float, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval_seconds:
+            return
+        self._last = now
+        if self.job_id in self.cancelled:
+            raise JobCancelled()
+        self.progress[self.job_id] = fraction
+
+def _interpolate(xs: List[float], ys: List[float], x: float) -> float:
+    """ Linear interpolation over xs sorted ascending """
+    i = bisect.bisect_left(xs, x)
+    if i <= 0:
+        return ys[0]
+    if i >= len(xs):
+        return ys[-1]
+    x0, x1 = xs[i - 1], xs[i]
+    if x1 == x0:
+        return ys[i]
+    return ys[i - 1] + (ys[i] - ys[i - 1]) * (x - x0) / (x1 - x0)
+
+def _tracked(rows: Iterator[Dict[str, Any]], total: int | None, report: Callable):
+    """ Passes the rows through, reporting the read fraction as the first 90% """
+    for i, row in enumerate(rows):
+        if i % 1000 == 0:
+            # Without a count, assume a million rows
+            report(0.9 * min(i / (total or 1000000), 1.0))
+        yield row
+
+def gg_envelope(rows: Iterable[Dict[str, Any]], params: Dict[str, Any], report: Callable) -> Dict[str, Any]:
+    """ Maximum combined acceleration per direction of the G-G diagram """
+    bins = int(params.get("bins", 36))
+    envelope = [None] * bins
+    for row in rows:
+        ax, ay = row.get("acc_x"), row.get("acc_y")
+        if ax is None or ay is None:
+            continue
+        radius = math.hypot(ax, ay)
+        b = int((math.atan2(ay, ax) + math.pi) / (2 * math.pi) * bins) % bins
+        if envelope[b] is None or radius > envelope[b]["radius_g"]:
+            envelope[b] = {"radius_g": radius, "acc_x": ax, "acc_y": ay}
+
+    return {
+        "bins": [
+            {"angle_deg": (b + 0.5) * 360 / bins - 180, **point}
+            for b, point in enumerate(envelope) if point is not None
+        ],
+        "max_g": max((p["radius_g"] for p in envelope if p), default=0.0),
+    }
+
+def histogram(rows: Iterable[Dict[str, Any]], params: Dict[str, Any], report: Callable) -> Dict[str, Any]:
+    """ Distribution of a channel, e.g. for suspension/damper tuning """
+    channel = params["channel"]
+    bins = int(params.get("bins", 50))
+    # The range may come from the data, only the values are kept (8 bytes each)
+    values = array("d", (row[channel] for row in rows if row.get(channel) is not None))
+    if not values:
+        return {"channel": channel, "edges": [], "counts": [], "count": 0}
+
+    low = float(params.get("min", min(values)))
+    high = float(params.get("max", max(values)))
+    width = (high - low) / bins or 1.0
+    counts = [0] * bins
+    total = len(values)
+    for i, value in enumerate(values):
+        if low <= value <= high:
+            counts[min(int((value - low) / width), bins - 1)] += 1
+        if i % 5000 == 0:
+            report(i / total)
+
+    return {
+        "channel": channel,
+        "edges": [low + width * b for b in range(bins + 1)],
+        "counts": counts,
+        "count": total,
+        "mean": sum(values) / total,
+    }
+
+def lap_overlay(rows: Iterable[Dict[str, Any]], params: Dict[str, Any], report: Callable) -> Dict[str, Any]:
+    """
+    Splits the session into laps with the same S/F logic used live and
+    resamples every lap by distance, with the delta time against the
+    reference lap (the best lap unless one is given).
+    """
+    # Offline, no live delta buffers or reference rebuild threads
+    processing = DataProcessing(lap_delta=False)
+    processing.set_sf_line(float(params["sf_lat"]), float(params["sf_lon"]))
+    step = float(params.get("step_m", 5.0))
+
+    laps: Dict[int, Dict[str, list]] = {}
+    lap_times: Dict[int, float] = {}
+    for row in rows:
+        # Laps are numbered as the live path does, by the count once completed
+        lap = processing.lap_count + 1
+        packet = processing.process_packet(dict(row))
+        current = packet.get("lap_count", lap - 1) + 1
+        if current != lap:
+            lap_times[lap] = processing.last_lap_time
+        samples = laps.setdefault(current, {"distance": [], "time": [], "speed": []})
+        if "lap_distance" in packet:
+            samples["distance"].append(packet["lap_distance"])
+            samples["time"].append(packet["current_lap_time"])
+            samples["speed"].append(packet.get("speed"))
+
+    # The first lap starts wherever the car was, only count laps started at the line
+    lap_times.pop(1, None)
+    if not lap_times:
+        return {"laps": [], "reference_lap": None, "overlay": {}}
+
+    reference = int(params.get("reference_lap", min(lap_times, key=lap_times.get)))
+    if reference not in lap_times:
+        raise ValueError(f"Lap {reference} is not a complete lap")
+    ref = laps[reference]
+
+    overlay = {}
+    for n, lap in enumerate(lap_times):
+        report(n / len(lap_times))
+        samples = laps[lap]
+        length = min(samples["distance"][-1], ref["distance"][-1])
+        points = []
+        for k in range(int(length // step) + 1):
+            d = k * step
+            t = _interpolate(samples["distance"], samples["time"], d)
+            speed = _interpolate(samples["distance"], [s or 0.0 for s in samples["speed"]], d)
+            points.append({
+                "distance": d,
+                "time": t,
+                "speed": speed,
+                "delta": t - _interpolate(ref["distance"], ref["time"], d),
+            })
+        overlay[lap] = points
+    report(1.0)
+
+    return {
+        "laps": [{"lap": lap, "time_ms": time_ms} for lap, time_ms in sorted(lap_times.items())],
+        "reference_lap": reference,
+        "overlay": overlay,
+    }
+
+def track_map(rows: Iterable[Dict[str, Any]], params: Dict[str, Any], report: Callable) -> Dict[str, Any]:
+    """ GPS trace thinned by distance, colored by a channel """
+    channel = params.get("channel", "speed")
+    spacing = float(params.get("min_spacing_m", 2.0))
+    haversine = DataProcessing(lap_delta=False).haversine
+
+    points = []
+    last = None
+    for row in rows:
+        lat, lon = row.get("latitude"), row.get("longitude")
+        if lat is None or lon is None:
+            continue
+        if last is None or haversine(lat, lon, *last) >= spacing:
+            points.append({"lat": lat, "lon": lon, "value": row.get(channel)})
+            last = (lat, lon)
+
+    bounds = None
+    if points:
+        bounds = {
+            "min_lat": min(p["lat"] for p in points), "max_lat": max(p["lat"] for p in points),
+            "min_lon": min(p["lon"] for p in points), "max_lon": max(p["lon"] for p in points),
+        }
+    return {"channel": channel, "points": points, "bounds": bounds}
+
+# kind -> (function, channels it needs)
+ANALYSES: Dict[str, tuple] = {
+    "gg": (gg_envelope, lambda p: ["acc_x", "acc_y"]),
+    "histogram": (histogram, lambda p: [p["channel"]]),
+    "laps": (lap_overlay, lambda p: ["latitude", "longitude", "speed", "timestamp"]),
+    "track-map": (track_map, lambda p: ["latitude", "longitude", p.get("channel", "speed")]),
+}
+
+def validate_params(kind: str, params: Dict[str, Any]):
+    """ Raises ValueError on bad parameters before a job is queued """
+    if kind not in ANALYSES:
+        raise ValueError(f"Unknown analysis: {kind}")
+    if kind == "histogram" and params.get("channel") not in DATA_CHANNELS:
+        raise ValueError("histogram needs a valid 'channel'")
+    if kind == "track-map" and params.get("channel", "speed") not in DATA_CHANNELS:
+        raise ValueError(f"Unknown channel: {params['channel']}")
+    if kind == "laps" and (params.get("sf_lat") is None or params.get("sf_lon") is None):
+        raise ValueError("laps needs the S/F line (sf_lat, sf_lon)")
+
+def run_analysis(kind: str, reader_config, session_id: int, params: Dict[str, Any],
+                 job_id: str, progress, cancelled) -> Dict[str, Any]:
+    """ Entry point of the worker processes """
+    report = _Progress(job_id, progress, cancelled)
+    function, channels = ANALYSES[kind]
+
+    cls, kwargs = reader_config
+    reader = cls(**kwargs)
+    total = reader.count_session(session_id)
+    rows = _tracked(reader.iter_session(session_id, channels(params)), total, report)
+
+    # The pass over the rows is most of the work, what the analysis does after it the rest
+    result = function(rows, params, lambda f: report(0.9 + 0.1 * f))
+    report(1.0, force=True)
+    return result
+
+class AnalyticsJob:
+    def __init__(self, job_id: str, kind: str, session_id: int, params: Dict[str, Any],
+                 key, use_cache: bool = True):
+        self.id = job_id
+        self.kind = kind
+        self.session_id = session_id
+        self.params = params
+        self.key = key
+        self.use_cache = use_cache
+        self.status = "queued" # queued, running, done, error, cancelled
+        self.result = None
+        self.error = None
+        self.future = None
+
+    def to_dict(self, progress: float) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "params": self.params,
+            "status": self.status,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+class AnalyticsService:
+    """
+    Runs analytics jobs in a process pool and keeps an LRU cache of results.
+    The pool and the shared progress dicts are only created on the first job.
+    """
+    def __init__(self, reader_config, workers: int = 2, cache_size: int = 32, max_jobs: int = 100):
+        self.reader_config = reader_config
+        self.workers = workers
+        self.cache_size = cache_size
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, AnalyticsJob]" = OrderedDict()
+        self._cache: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        # Reentrant, a future that is already done runs _finish inside submit
+        self._lock = threading.RLock()
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._cancelled = None
+
+    def _ensure_pool(self):
+        if self._executor is None:
+            # Imported here, most sessions never run an analysis
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Spawned workers don't inherit the server's threads, sockets or event loop
+            context = multiprocessing.get_context("spawn")
+            self._manager = context.Manager()
+            self._progress = self._manager.dict()
+            self._cancelled = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            logger.info(f"[Analytics] Process pool started with {self.workers} workers")
+
+    def submit(self, kind: str, session_id: int, params: Dict[str, Any], use_cache: bool = True) -> AnalyticsJob:
+        validate_params(kind, params)
+        key = (kind, session_id, json.dumps(params, sort_keys=True))
+
+        with self._lock:
+            # Same analysis already queued or running
+            for job in self.jobs.values():
+                if job.key == key and job.status in ("queued", "running"):
+                    return job
+
+            job = AnalyticsJob(uuid.uuid4().hex, kind, session_id, params, key, use_cache)
+            self._add_job(job)
+            if use_cache and key in self._cache:
+                self._cache.move_to_end(key)
+                job.status = "done"
+                job.result = self._cache[key]
+                return job
+
+            # Under the lock, concurrent submits must not start two pools
+            self._ensure_pool()
+            self._progress[job.id] = 0.0
+            job.future = self._executor.submit(
+                run_analysis, kind, self.reader_config, session_id, params,
+                job.id, self._progress, self._cancelled,
+            )
+            job.future.add_done_callback(lambda future: self._finish(job, future))
+            return job
+
+    def _add_job(self, job: AnalyticsJob):
+        self.jobs[job.id] = job
+        # Forget the oldest finished jobs
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].status not in ("queued", "running"):
+                self._forget(job_id)
+
+    def _forget(self, job_id: str):
+        self.jobs.pop(job_id, None)
+        if self._progress is not None:
+            self._progress.pop(job_id, None)
+            self._cancelled.pop(job_id, None)
+
+    def _finish(self, job: AnalyticsJob, future):
+        """ Runs on the executor's management thread """
+        with self._lock:
+            # Cancelled while running, the worker finished before seeing the flag
+            if job.status == "cancelled":
+                return
+            try:
+                job.result = future.result()
+                job.status = "done"
+            except (CancelledError, JobCancelled):
+                job.status = "cancelled"
+                return
+            except Exception as e:
+                job.status = "error"
+                job.error = str(e)
+                logger.error(f"[Analytics] Job {job.id} ({job.kind}) failed: {e}")
+                return
+
+            if job.use_cache:
+                self._cache[job.key] = job.result
+                self._cache.move_to_end(job.key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job.status == "queued" and job.future is not None and job.future.running():
+            job.status = "running"
+        progress = 1.0 if job.status == "done" else self._progress.get(job.id, 0.0)
+        return job.to_dict(progress)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            # Still queued jobs never start, running ones stop at their next progress report
+            if not job.future.cancel():
+                self._cancelled[job.id] = True
+            job.status = "cancelled"
+            return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            for job in self.jobs.values():
+                if job.status in ("queued", "running"):
+                    self._cancelled[job.id] = True
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._manager.shutdown()
+            self._executor = None
+            logger.info("[Analytics] Process pool stopped")
@@ -6,8 +6,10 @@
 import math
 import time
 
+from services.lap_delta import LapDeltaTracker
+
 class DataProcessing:
-    def __init__(self):
+    def __init__(self, lap_delta: bool = True):
         self.sf_line = None # (lat, lon)
         self.sf_radius = 10 # meters
         self.current_lap_start = 0 # ms
@@ -16,7 +18,9 @@ class DataProcessing:
         self.last_pos = None # (lat, lon) or None
         self.total_distance = 0 # m
         self.lap_distance = 0 # m
-        
+        # Delta time against the reference lap, only the live path needs it
+        self.lap_delta = LapDeltaTracker() if lap_delta else None
+
     def set_sf_line(self, lat, lon):
         self.sf_line = (lat, lon)
         print(f"[DataProcessing] Start/Finish line set to: {self.sf_line}")
@@ -82,9 +86,24 @@ class DataProcessing:
         # Add to packet
         data['total_distance'] = self.total_distance
         data['lap_distance'] = self.lap_distance
+
+        # Delta against the reference lap, positive means slower
+        # Without a S/F line no lap ever completes, so there is nothing to record
+        if self.lap_delta:
+            data['lap_delta'] = None
+            if self.sf_line:
+                data['lap_delta'] = self.lap_delta.add_sample(self.lap_distance, data['current_lap_time'])
+            reference = self.lap_delta.reference
+            data['reference_lap'] = reference.lap if reference else None
         
         return data
 
+    def set_reference_lap(self, lap=None):
+        """ Compares against the given lap, or the best lap when None """
+        if not self.lap_delta:
+            return False
+        return self.lap_delta.set_reference(lap)
+
     def complete_lap(self, now):
         lap_time = now - self.current_lap_start
         self.lap_count += 1
@@ -95,6 +114,10 @@ class DataProcessing:
         if self.best_lap == 0 or lap_time < self.best_lap:
             self.best_lap = lap_time
             print(f"[DataProcessing] New Best Lap: {self.best_lap/1000:.2f}s")
+
+        # The reference is rebuilt in the background if needed
+        if self.lap_delta:
+            self.lap_delta.complete_lap(self.lap_count, lap_time)
             
         self.current_lap_start = now
         print(f"[DataProcessing] Lap {self.lap_count} completed.")
@@ -1,15 +1,21 @@
 # server/services/database.py
 import sqlite3
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List
 
-class DatabaseService:
+from services.rollups import RollupAggregator, RollupRow
+from services.storage import StorageBackend, TELEMETRY_CHANNELS, DATA_CHANNELS, LAST_ONLY_CHANNELS
+
+class DatabaseService(StorageBackend):
+    """
+    SQLite storage backend.
+    """
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.conn = None
         self.cursor = None
         self.session_id = None
-        self._lock = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.rollups = RollupAggregator(DATA_CHANNELS, last_only=LAST_ONLY_CHANNELS)
 
     def connect(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
@@ -21,7 +27,10 @@ class DatabaseService:
 
     def close(self):
         if self.conn:
+            self._save_rollups(self.rollups.flush())
+            self.conn.commit()
             self.conn.close()
+            self.conn = None
             print("[Database] Conexão fechada.")
 
     def create_schema(self):
@@ -46,19 +55,42 @@ class DatabaseService:
                 timestamp INTEGER,
                 FOREIGN KEY(session_id) REFERENCES sessions(id)
             );
+
+            CREATE INDEX IF NOT EXISTS idx_telemetry_session_time
+                ON telemetry (session_id, timestamp);
+
+            CREATE TABLE IF NOT EXISTS telemetry_rollup (
+                session_id INTEGER NOT NULL,
+                resolution_ms INTEGER NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                min REAL, max REAL, mean REAL, last REAL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (session_id, resolution_ms, bucket_start, channel),
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
+            ) WITHOUT ROWID;
         """)
         self.conn.commit()
         print("[Database] Esquema verificado/criado.")
 
     def start_new_session(self, label: str = "Default Session"):
+        # Close the rollup buckets of the previous session before switching
+        self._save_rollups(self.rollups.flush())
         self.cursor.execute("INSERT INTO sessions (label) VALUES (?);", (label,))
         self.conn.commit()
         self.session_id = self.cursor.lastrowid
         print(f"[Database] Nova sessão iniciada com ID: {self.session_id}")
 
-    def save_telemetry_data(self, packet: Dict[str, Any]):
+    @property
+    def is_connected(self) -> bool:
+        return self.conn is not None
+
+    def status(self):
+        return {"backend": "sqlite", "connected": self.is_connected, "session_id": self.session_id}
+
+    def save_telemetry_batch(self, packets: List[Dict[str, Any]]):
         """
-        Saves a telemetry packet to the database.
+        Saves telemetry packets to the database in a single transaction.
         If no session is active, it starts one automatically.
         """
         if not self.conn:
@@ -71,21 +103,164 @@ class DatabaseService:
                 print("[Database] Error: Failed to start a new session. Cannot save data.")
                 return
 
-        self.cursor.execute("""
-            INSERT INTO telemetry (
-                session_id, acc_x, acc_y, acc_z, dps_x, dps_y, dps_z,
-                roll, pitch, rpm, speed, temperature, soc, temp_cvt,
-                volt, current, flags, latitude, longitude, timestamp
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """, (
-            self.session_id,
-            packet.get("acc_x"), packet.get("acc_y"), packet.get("acc_z"),
-            packet.get("dps_x"), packet.get("dps_y"), packet.get("dps_z"),
-            packet.get("roll"), packet.get("pitch"),
-            packet.get("rpm"), packet.get("speed"),
-            packet.get("temperature"), packet.get("soc"), packet.get("temp_cvt"),
-            packet.get("volt"), packet.get("current"),
-            packet.get("flags"), packet.get("latitude"), packet.get("longitude"),
-            packet.get("timestamp"),
-        ))
+        self.cursor.executemany(f"""
+            INSERT INTO telemetry (session_id, {", ".join(TELEMETRY_CHANNELS)})
+            VALUES (?{",?" * len(TELEMETRY_CHANNELS)})
+        """, [(self.session_id, *(packet.get(c) for c in TELEMETRY_CHANNELS)) for packet in packets])
+
+        # Keep the rollup levels up to date as the data arrives
+        for packet in packets:
+            if packet.get("timestamp") is not None:
+                self._save_rollups(self.rollups.add(packet["timestamp"], packet))
+
         self.conn.commit()
+
+    def _save_rollups(self, rows: List[RollupRow]):
+        """
+        Writes closed rollup buckets.
+        A bucket that already exists (e.g. the ECU clock went back) is merged.
+        """
+        if not rows or not self.conn or self.session_id is None:
+            return
+        self.cursor.executemany("""
+            INSERT INTO telemetry_rollup (
+                session_id, resolution_ms, bucket_start, channel,
+                min, max, mean, last, count
+            ) VALUES (?,?,?,?,?,?,?,?,?)
+            ON CONFLICT (session_id, resolution_ms, bucket_start, channel) DO UPDATE SET
+                min = MIN(min, excluded.min),
+                max = MAX(max, excluded.max),
+                mean = (mean * count + excluded.mean * excluded.count) / (count + excluded.count),
+                last = excluded.last,
+                count = count + excluded.count
+        """, [(self.session_id, *row) for row in rows])
+
+    def _read_connection(self):
+        """
+        Read only connection for queries that run off the event loop.
+        WAL lets it read alongside the ingest writes.
+        """
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def get_session_span(self, session_id: int):
+        level = self.rollups.levels[-1]
+        conn = self._read_connection()
+        try:
+            row = conn.execute("""
+                SELECT MIN(bucket_start), MAX(bucket_start) + ? FROM telemetry_rollup
+                WHERE session_id = ? AND resolution_ms = ?
+            """, (level, session_id, level)).fetchone()
+        finally:
+            conn.close()
+
+        first, last = row
+        if session_id == self.session_id:
+            open_rows = self.rollups.snapshot(level)
+            if open_rows:
+                bucket_start = open_rows[0][1]
+                first = bucket_start if first is None else min(first, bucket_start)
+                last = bucket_start + level if last is None else max(last, bucket_start + level)
+
+        if first is None:
+            return None
+        return first, last
+
+    def query_telemetry(self, session_id: int, start: int, end: int,
+                        resolution_ms: float, channels: Iterable[str] | None = None,
+                        max_points: int | None = None):
+        """ Uses the rollup table, or the raw rows below the finest level """
+        channels = [c for c in (channels or DATA_CHANNELS) if c in DATA_CHANNELS]
+        level = self.rollups.pick_level(resolution_ms)
+        if not channels:
+            return level or 0, []
+
+        conn = self._read_connection()
+        try:
+            if max_points is not None:
+                # A level (or raw rows) that would return more than max_points
+                # is coarsened, truncating would drop the end of the range
+                fit = self.rollups.fit_level(end - start, max(max_points, 1))
+                if level is None:
+                    count = conn.execute("""
+                        SELECT COUNT(*) FROM telemetry
+                        WHERE session_id = ? AND timestamp BETWEEN ? AND ?
+                    """, (session_id, start, end)).fetchone()[0]
+                    if count > max_points:
+                        level = fit
+                elif fit > level:
+                    level = fit
+
+            if level is None:
+                rows = conn.execute(f"""
+                    SELECT timestamp, {", ".join(channels)} FROM telemetry
+                    WHERE session_id = ? AND timestamp BETWEEN ? AND ?
+                    ORDER BY timestamp
+                """, (session_id, start, end)).fetchall()
+                return 0, [{"timestamp": row[0], **dict(zip(channels, row[1:]))} for row in rows]
+
+            # A bucket that starts before start still holds samples of the range
+            rows = conn.execute(f"""
+                SELECT resolution_ms, bucket_start, channel, min, max, mean, last, count
+                FROM telemetry_rollup
+                WHERE session_id = ? AND resolution_ms = ?
+                    AND bucket_start > ? AND bucket_start <= ?
+                    AND channel IN ({", ".join("?" * len(channels))})
+                ORDER BY bucket_start
+            """, (session_id, level, start - level, end, *channels)).fetchall()
+        finally:
+            conn.close()
+
+        # The open bucket of the live session is not in the table yet
+        if session_id == self.session_id:
+            rows += [r for r in self.rollups.snapshot(level)
+                     if start - level < r[1] <= end and r[2] in channels]
+
+        points: Dict[int, Dict[str, Any]] = {}
+        for _, bucket_start, channel, vmin, vmax, vmean, vlast, _ in rows:
+            point = points.setdefault(bucket_start, {"timestamp": bucket_start})
+            if channel in LAST_ONLY_CHANNELS:
+                point[channel] = {"last": vlast}
+            else:
+                point[channel] = {"min": vmin, "max": vmax, "mean": vmean, "last": vlast}
+        return level, list(points.values())
+
+    def reader_config(self):
+        return DatabaseService, {"db_path": self.db_path}
+
+    def count_session(self, session_id: int):
+        conn = self._read_connection()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM telemetry WHERE session_id = ?",
+                                (session_id,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def iter_session(self, session_id: int, channels: Iterable[str],
+                     start: int | None = None, end: int | None = None, chunk_size: int = 5000):
+        channels = [c for c in channels if c in TELEMETRY_CHANNELS]
+        # Read only connection, WAL lets it run alongside the ingest writes.
+        # Streaming responses may resume the generator on another thread.
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        # Without a range, rows with a NULL timestamp are exported too
+        where = "session_id = ?"
+        params = [session_id]
+        if start is not None:
+            where += " AND timestamp >= ?"
+            params.append(start)
+        if end is not None:
+            where += " AND timestamp <= ?"
+            params.append(end)
+        try:
+            cursor = conn.execute(f"""
+                SELECT {", ".join(channels)} FROM telemetry
+                WHERE {where}
+                ORDER BY timestamp, id
+            """, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(channels, row))
+        finally:
+            conn.close()
@@ -0,0 +1,57 @@
+"""
+    Session export encoders.
+
+    Rows are encoded in chunks while they are read, so an export of any size
+    only keeps one chunk in memory.
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+def _encode_csv(rows: List[Dict[str, Any]], channels: List[str], header: bool) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(channels)
+    writer.writerows([row.get(c) for c in channels] for row in rows)
+    return out.getvalue().encode()
+
+def _encode_ndjson(rows: List[Dict[str, Any]], channels: List[str], header: bool) -> bytes:
+    return "".join(json.dumps({c: row.get(c) for c in channels}) + "\n" for row in rows).encode()
+
+def export_session(rows: Iterable[Dict[str, Any]], channels: List[str], fmt: str,
+                   compress: bool = False, chunk_rows: int = 5000) -> Iterator[bytes]:
+    """
+    Encodes rows as CSV or NDJSON, optionally gzip compressed.
+    Yields one block of bytes per chunk_rows rows.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    # wbits=31 writes a gzip header, so the output is a regular .gz file
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    chunk = []
+    header = True
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) < chunk_rows:
+            continue
+        data = encode(chunk, channels, header)
+        chunk.clear()
+        header = False
+        data = gzip.compress(data) if gzip else data
+        if data:
+            yield data
+
+    data = encode(chunk, channels, header)
+    if gzip:
+        data = gzip.compress(data) + gzip.flush()
+    if data:
+        yield data
@@ -0,0 +1,395 @@
+"""
+    InfluxDB (v2 HTTP API) storage backend.
+
+    Packets are converted to line protocol and written in gzip compressed
+    batches by a background thread, so the ingest loop never waits for the
+    network. Batches that can't be delivered after the retries are spilled
+    to disk and replayed, oldest first, once the server is reachable again.
+    Batches the server rejects are kept apart in spill_path/rejected.
+
+    Points are stamped with the server receive time (ns), the ECU clock is
+    a counter since boot and is kept as the ecu_timestamp field.
+"""
+
+import csv
+import gzip
+import io
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+from services.rollups import fit_level, pick_level
+from services.storage import StorageBackend, DATA_CHANNELS, LAST_ONLY_CHANNELS
+
+logger = logging.getLogger(__name__)
+
+# Field holding the ECU counter, the point time is the receive time
+ECU_TIMESTAMP = "ecu_timestamp"
+
+# Aggregates returned for each window, matching the SQLite rollups
+AGGREGATES = ("min", "max", "mean", "last")
+
+def _escape_tag(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+def _escape_string_field(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def _parse_time_ms(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+class InfluxLineProtocolBackend(StorageBackend):
+    """
+    Batched line protocol writer with retries and an on-disk spill queue.
+    Points are stamped with the server receive time, so timestamp and
+    start/end are Unix ms here and the ECU counter is the ecu_timestamp field.
+    """
+    time_channels = ("timestamp", ECU_TIMESTAMP)
+    def __init__(self,
+                 url: str,
+                 token: str,
+                 org: str,
+                 bucket: str,
+                 batch_size: int = 500,
+                 flush_interval_seconds: float = 1.0,
+                 max_retries: int = 3,
+                 spill_path: str = "./data/influx_spill",
+                 timeout_seconds: float = 5.0,
+                 measurement: str = "telemetry"):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.org = org
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self.timeout_seconds = timeout_seconds
+        self.measurement = measurement
+        self.session_id = None
+        self._pending: List[str] = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.rejected_batches = 0
+
+    @property
+    def is_connected(self) -> bool:
+        return self._thread is not None
+
+    def connect(self):
+        os.makedirs(self.spill_path, exist_ok=True)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"[InfluxDB] Writing to {self.url} (bucket: {self.bucket})")
+
+    def close(self):
+        if self._thread:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        # Whatever is left is delivered or spilled
+        self.flush()
+        logger.info("[InfluxDB] Writer stopped.")
+
+    def start_new_session(self, label: str = "Default Session"):
+        self.session_id = int(time.time() * 1000)
+        self._enqueue([
+            f'sessions,session={self.session_id} label="{_escape_string_field(label)}" {self.session_id * 1000000}'
+        ])
+        logger.info(f"[InfluxDB] New session started with ID: {self.session_id}")
+
+    def save_telemetry_batch(self, packets: List[Dict[str, Any]]):
+        if self.session_id is None:
+            logger.warning("[InfluxDB] No active session. Starting a new 'auto' session.")
+            self.start_new_session(label="Auto-Session")
+        # Packets of a batch share the receive time, the offset keeps them apart
+        received_ns = time.time_ns()
+        lines = (self._to_line(packet, received_ns + i) for i, packet in enumerate(packets))
+        self._enqueue([line for line in lines if line])
+
+    def _to_line(self, packet: Dict[str, Any], timestamp_ns: int) -> str | None:
+        fields = [
+            f"{channel}={float(packet[channel])!r}"
+            for channel in DATA_CHANNELS if packet.get(channel) is not None
+        ]
+        if not fields:
+            return None
+        if packet.get("timestamp") is not None:
+            fields.append(f"{ECU_TIMESTAMP}={int(packet['timestamp'])}i")
+        return f"{_escape_tag(self.measurement)},session={self.session_id} {','.join(fields)} {timestamp_ns}"
+
+    def _enqueue(self, lines: List[str]):
+        with self._pending_lock:
+            self._pending.extend(lines)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        """ Background loop, flushes every interval or when a batch is full """
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """ Sends the pending lines, spilling them to disk on failure """
+        with self._flush_lock:
+            with self._pending_lock:
+                lines, self._pending = self._pending, []
+
+            # Spilled batches go first so the server receives them in order
+            delivered = self._drain_spill()
+            for i in range(0, len(lines), self.batch_size):
+                body = gzip.compress("\n".join(lines[i:i + self.batch_size]).encode())
+                result = self._post(body) if delivered else "failed"
+                if result == "rejected":
+                    self._reject(body)
+                elif result == "failed":
+                    delivered = False
+                    logger.warning(f"[InfluxDB] Batch spilled to {self._spill(body)}")
+
+    def _post(self, body: bytes) -> str:
+        """
+        Writes a gzip compressed batch.
+        Returns "ok", "rejected" if the server will never accept it, or
+        "failed" when it should be retried later.
+        """
+        query = urllib.parse.urlencode({"org": self.org, "bucket": self.bucket, "precision": "ns"})
+        request = urllib.request.Request(
+            f"{self.url}/api/v2/write?{query}",
+            data=body,
+            method="POST",
+            headers={
+                "Authorization": f"Token {self.token}",
+                "Content-Type": "text/plain; charset=utf-8",
+                "Content-Encoding": "gzip",
+            },
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout_seconds):
+                    return "ok"
+            except urllib.error.HTTPError as e:
+                # Malformed data (or outside the retention) will never be
+                # accepted, retrying it would block the queue
+                if e.code in (400, 422):
+                    logger.error(f"[InfluxDB] Batch rejected ({e.code}): {e.read()[:200]!r}")
+                    return "rejected"
+                logger.warning(f"[InfluxDB] Write failed ({e.code}), attempt {attempt + 1}")
+            except (urllib.error.URLError, OSError) as e:
+                logger.warning(f"[InfluxDB] Server unreachable: {e}, attempt {attempt + 1}")
+            if attempt < self.max_retries and not self._stopping.is_set():
+                time.sleep(min(2 ** attempt * 0.5, 10))
+        return "failed"
+
+    def _spill(self, body: bytes, directory: str | None = None) -> str:
+        directory = directory or self.spill_path
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.time_ns()}.lp.gz")
+        with open(path + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def _reject(self, body: bytes):
+        """ Keeps a rejected batch for inspection, it is not replayed """
+        self.rejected_batches += 1
+        path = self._spill(body, os.path.join(self.spill_path, "rejected"))
+        logger.error(f"[InfluxDB] {self.rejected_batches} rejected batch(es), last one saved to {path}")
+
+    def status(self):
+        with self._pending_lock:
+            pending = len(self._pending)
+        spilled = 0
+        if os.path.isdir(self.spill_path):
+            spilled = sum(n.endswith(".lp.gz") for n in os.listdir(self.spill_path))
+        return {
+            "backend": "influxdb",
+            "connected": self.is_connected,
+            "pending_lines": pending,
+            "spilled_batches": spilled,
+            "rejected_batches": self.rejected_batches,
+        }
+
+    def _drain_spill(self) -> bool:
+        """ Replays spilled batches, returns False if any is still pending """
+        if not os.path.isdir(self.spill_path):
+            return True
+        for name in sorted(n for n in os.listdir(self.spill_path) if n.endswith(".lp.gz")):
+            path = os.path.join(self.spill_path, name)
+            with open(path, "rb") as f:
+                body = f.read()
+            result = self._post(body)
+            if result == "failed":
+                return False
+            if result == "rejected":
+                self._reject(body)
+            else:
+                logger.info(f"[InfluxDB] Spilled batch {name} delivered")
+            os.remove(path)
+        return True
+
+    def _query(self, flux: str) -> List[Dict[str, str]]:
+        """ Runs a Flux query and returns the CSV rows as dicts """
+        return list(self._iter_query(flux))
+
+    def _iter_query(self, flux: str) -> Iterator[Dict[str, str]]:
+        """ Runs a Flux query and yields the CSV rows as dicts while they are read """
+        request = urllib.request.Request(
+            f"{self.url}/api/v2/query?{urllib.parse.urlencode({'org': self.org})}",
+            data=flux.encode(),
+            method="POST",
+            headers={
+                "Authorization": f"Token {self.token}",
+                "Content-Type": "application/vnd.flux",
+                "Accept": "application/csv",
+            },
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout_seconds) as response:
+            header = None
+            for row in csv.reader(io.TextIOWrapper(response, encoding="utf-8", newline="")):
+                # Tables are separated by blank lines and repeat their header
+                if not row or not any(row):
+                    header = None
+                    continue
+                if row[0].startswith("#") or row == header:
+                    continue
+                if header is None:
+                    header = row
+                    continue
+                yield dict(zip(header, row))
+
+    def _session_data(self, session_id: int, start: int, end: int, channels: List[str]) -> str:
+        field_set = ", ".join(f'"{c}"' for c in channels)
+        return f'''
+            from(bucket: "{self.bucket}")
+                |> range(start: time(v: {int(start) * 1000000}), stop: time(v: {int(end) * 1000000 + 1}))
+                |> filter(fn: (r) => r._measurement == "{self.measurement}" and r.session == "{int(session_id)}")
+                |> filter(fn: (r) => contains(value: r._field, set: [{field_set}]))
+        '''
+
+    def get_session_span(self, session_id: int):
+        data = self._session_data(session_id, 0, int(time.time() * 1000) + 86400000, ["rpm"])
+        rows = self._query(f'''
+            data = {data}
+            union(tables: [data |> first(), data |> last()])
+                |> keep(columns: ["_time"])
+        ''')
+        if not rows:
+            return None
+        times = [_parse_time_ms(row["_time"]) for row in rows]
+        return min(times), max(times)
+
+    def query_telemetry(self, session_id: int, start: int, end: int,
+                        resolution_ms: float, channels: Iterable[str] | None = None,
+                        max_points: int | None = None):
+        """ Aggregates server side with windows of the same widths as the SQLite rollups """
+        channels = [c for c in (channels or DATA_CHANNELS) if c in DATA_CHANNELS]
+        level = pick_level(resolution_ms)
+        if not channels:
+            return level or 0, []
+        data = self._session_data(session_id, start, end, [*channels, ECU_TIMESTAMP])
+
+        if max_points is not None:
+            # A window (or raw samples) that would return more than max_points
+            # points is coarsened, truncating would drop the end of the range
+            fit = fit_level(end - start, max(max_points, 1))
+            if level is None:
+                rows = self._query(f'{data} |> count() |> group() |> max()')
+                if rows and int(rows[0]["_value"]) > max_points:
+                    level = fit
+            elif fit > level:
+                level = fit
+
+        points: Dict[int, Dict[str, Any]] = {}
+        if level is None:
+            for row in self._query(f'{data} |> keep(columns: ["_time", "_field", "_value"])'):
+                timestamp = _parse_time_ms(row["_time"])
+                point = points.setdefault(timestamp, {"timestamp": timestamp})
+                if row["_field"] == ECU_TIMESTAMP:
+                    point[ECU_TIMESTAMP] = int(row["_value"])
+                else:
+                    point[row["_field"]] = float(row["_value"])
+            return 0, sorted(points.values(), key=lambda p: p["timestamp"])
+
+        windows = ", ".join(
+            f'data |> aggregateWindow(every: {level}ms, fn: {fn}, createEmpty: false, timeSrc: "_start")'
+            f' |> set(key: "agg", value: "{fn}")'
+            for fn in AGGREGATES
+        )
+        rows = self._query(f'''
+            data = {data}
+            union(tables: [{windows}])
+                |> keep(columns: ["_time", "_field", "_value", "agg"])
+        ''')
+        for row in rows:
+            field = row["_field"]
+            if (field in LAST_ONLY_CHANNELS or field == ECU_TIMESTAMP) and row["agg"] != "last":
+                continue
+            timestamp = _parse_time_ms(row["_time"])
+            point = points.setdefault(timestamp, {"timestamp": timestamp})
+            if field == ECU_TIMESTAMP:
+                # ECU counter of the last sample of the window
+                point[ECU_TIMESTAMP] = int(float(row["_value"]))
+            else:
+                point.setdefault(field, {})[row["agg"]] = float(row["_value"])
+        return level, sorted(points.values(), key=lambda p: p["timestamp"])
+
+    def reader_config(self):
+        return InfluxLineProtocolBackend, {
+            "url": self.url,
+            "token": self.token,
+            "org": self.org,
+            "bucket": self.bucket,
+            "timeout_seconds": self.timeout_seconds,
+            "measurement": self.measurement,
+        }
+
+    def count_session(self, session_id: int):
+        data = self._session_data(session_id, 0, int(time.time() * 1000) + 86400000, list(DATA_CHANNELS))
+        rows = self._query(f'{data} |> count() |> group() |> max()')
+        return int(rows[0]["_value"]) if rows else 0
+
+    def iter_session(self, session_id: int, channels: Iterable[str],
+                     start: int | None = None, end: int | None = None):
+        """
+        Streams the rows, one per sample, as the server sends them.
+        timestamp is the receive time, ask for ecu_timestamp to get the ECU counter.
+        """
+        channels = list(channels)
+        data_channels = [c for c in channels if c in DATA_CHANNELS]
+        fields = data_channels + [ECU_TIMESTAMP] if ECU_TIMESTAMP in channels else data_channels
+        if start is None:
+            start = 0
+        if end is None:
+            end = int(time.time() * 1000) + 86400000
+        if not data_channels:
+            return
+        # Pivoted server side, so each CSV row already is a whole sample
+        data = self._session_data(session_id, start, end, fields)
+        rows = self._iter_query(f'''
+            {data}
+                |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+                |> group()
+                |> sort(columns: ["_time"])
+        ''')
+        for row in rows:
+            point = {"timestamp": _parse_time_ms(row["_time"])}
+            for c in data_channels:
+                value = row.get(c)
+                point[c] = float(value) if value else None
+            if row.get(ECU_TIMESTAMP):
+                point[ECU_TIMESTAMP] = int(row[ECU_TIMESTAMP])
+            yield {c: point.get(c) for c in channels}
@@ -0,0 +1,151 @@
+"""
+    Live delta time against a reference lap.
+
+    The reference lap is stored as lap time indexed by lap distance, so the
+    time the reference took to reach the current distance is a lookup plus
+    an interpolation. The cursor follows the car along the lap, which makes
+    the lookup amortized O(1), with a binary search when it jumps back.
+"""
+
+import bisect
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+class ReferenceLap:
+    """
+    Sorted (distance, time) arrays of a completed lap.
+    """
+    __slots__ = ("lap", "lap_time", "distance", "time", "_cursor")
+
+    def __init__(self, lap: int, lap_time: float, distance: array, time: array):
+        self.lap = lap
+        self.lap_time = lap_time
+        self.distance = distance
+        self.time = time
+        self._cursor = 0
+
+    @classmethod
+    def build(cls, lap: int, lap_time: float, distance: array, time: array):
+        """
+        Builds the reference from the samples of a lap.
+        Samples that don't move the car forward (stopped, GPS noise) are
+        dropped so that distance is strictly increasing.
+        """
+        ref_distance = array("d")
+        ref_time = array("d")
+        last = -1.0
+        for i in range(len(distance)):
+            if distance[i] > last:
+                ref_distance.append(distance[i])
+                ref_time.append(time[i])
+                last = distance[i]
+        return cls(lap, lap_time, ref_distance, ref_time)
+
+    def time_at(self, distance: float) -> float | None:
+        """ Reference lap time at the given lap distance """
+        d = self.distance
+        n = len(d)
+        if n == 0:
+            return None
+        if distance <= d[0]:
+            return self.time[0]
+        if distance >= d[-1]:
+            return self.time[-1]
+
+        i = self._cursor
+        if d[i] > distance:
+            # Went backwards (new lap or GPS jump), search again
+            i = bisect.bisect_right(d, distance) - 1
+        else:
+            while i + 1 < n and d[i + 1] <= distance:
+                i += 1
+        self._cursor = i
+
+        d0 = d[i]
+        d1 = d[i + 1]
+        t0 = self.time[i]
+        return t0 + (self.time[i + 1] - t0) * (distance - d0) / (d1 - d0)
+
+class LapDeltaTracker:
+    """
+    Records the current lap in preallocated buffers and compares every
+    sample against the reference lap.
+    New references are built on a background thread and swapped in when
+    ready, the live path never waits for them.
+    """
+    initial_capacity = 4096
+    recent_laps = 5 # Laps kept besides the best one, so they can be chosen as reference
+
+    def __init__(self):
+        self.reference: ReferenceLap | None = None
+        self.reference_mode = "best" # "best" or a lap number
+        self.best_lap = None # Fastest full lap, the out-lap never counts
+        self.laps = {} # lap -> (lap_time, distance, time), trimmed copies
+        self._distance = array("d", bytes(8 * self.initial_capacity))
+        self._time = array("d", bytes(8 * self.initial_capacity))
+        self._count = 0
+        self._executor = None
+
+    def add_sample(self, lap_distance: float, lap_time: float) -> float | None:
+        """ Records a sample and returns the delta time (ms) to the reference """
+        n = self._count
+        if n == len(self._distance):
+            # Doubling keeps the growth amortized
+            self._distance.extend(self._distance)
+            self._time.extend(self._time)
+        self._distance[n] = lap_distance
+        self._time[n] = lap_time
+        self._count = n + 1
+
+        reference = self.reference
+        if reference is None:
+            return None
+        return lap_time - reference.time_at(lap_distance)
+
+    def complete_lap(self, lap: int, lap_time: float):
+        """ Stores the finished lap and starts recording a new one in the same buffers """
+        count = self._count
+        self._count = 0
+        # Lap 1 starts wherever the first packet arrived, it can't be a reference
+        if lap <= 1:
+            return
+
+        self.laps[lap] = (lap_time, self._distance[:count], self._time[:count])
+        is_best = self.best_lap is None or lap_time < self.laps[self.best_lap][0]
+        if is_best:
+            self.best_lap = lap
+        if (self.reference_mode == "best" and is_best) or self.reference_mode == lap:
+            self._rebuild(lap)
+        self._prune(lap)
+
+    def _prune(self, current: int):
+        """ Keeps the best lap, the chosen reference and the most recent laps """
+        keep = {self.best_lap, self.reference_mode}
+        for lap in list(self.laps):
+            if lap not in keep and lap <= current - self.recent_laps:
+                del self.laps[lap]
+
+    def set_reference(self, lap: int | None = None) -> bool:
+        """
+        Uses the given lap as reference, or follows the best lap when lap is None.
+        Returns False if the lap isn't stored anymore (or never completed).
+        """
+        if lap is None:
+            self.reference_mode = "best"
+            if self.best_lap is not None:
+                self._rebuild(self.best_lap)
+            return True
+        if lap not in self.laps:
+            return False
+        self.reference_mode = lap
+        self._rebuild(lap)
+        return True
+
+    def _rebuild(self, lap: int):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lap-reference")
+        future = self._executor.submit(ReferenceLap.build, lap, *self.laps[lap])
+        future.add_done_callback(self._swap)
+
+    def _swap(self, future):
+        self.reference = future.result()
@@ -0,0 +1,133 @@
+"""
+    Radio link quality accounting.
+
+    Every received frame updates running sums over a sliding time window,
+    so packet loss, CRC errors, jitter and throughput are available at any
+    time without rescanning the history.
+
+    Losses are only confirmed when a later sequence number arrives, so while
+    the link is silent the frames missed since the last one are estimated
+    from the usual inter-arrival time.
+"""
+
+import time
+from collections import deque
+from typing import Any, Dict
+
+def crc16_ccitt(data: bytes, crc: int = 0xFFFF) -> int:
+    """ CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), as used by the firmware """
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+            crc &= 0xFFFF
+    return crc
+
+class LinkQualityMonitor:
+    """
+    Rolling link statistics over the last window_seconds.
+    """
+    def __init__(self, window_seconds: float = 10.0):
+        self.window_seconds = window_seconds
+        # (arrival, received, lost, crc_errors, payload_bytes)
+        self._events = deque()
+        self._received = 0
+        self._lost = 0
+        self._crc_errors = 0
+        self._bytes = 0
+        self._last_seq = None
+        self._last_arrival = None
+        self._last_interval = None
+        self.jitter_ms = 0.0 # RFC 3550 style smoothed inter-arrival variation
+        self.interval_ms = 0.0 # Smoothed inter-arrival time
+        # Totals since start
+        self.total_received = 0
+        self.total_lost = 0
+        self.total_crc_errors = 0
+
+    def on_frame(self, payload_bytes: int, seq: int | None = None, crc_ok: bool = True,
+                 now: float | None = None) -> bool:
+        """
+        Accounts a received frame, seq is the 16 bit sequence number if the framer has one.
+        Returns False for frames that must be dropped (corrupted or duplicated).
+        """
+        now = time.monotonic() if now is None else now
+
+        if not crc_ok:
+            # The sequence number of a corrupted frame can't be trusted either
+            self._push(now, 0, 0, 1, 0)
+            self.total_crc_errors += 1
+            return False
+
+        lost = 0
+        if seq is not None:
+            if self._last_seq is not None:
+                gap = (seq - self._last_seq) & 0xFFFF
+                if gap == 0:
+                    # Duplicate, the radio retransmitted it
+                    return False
+                if gap < 0x8000:
+                    lost = gap - 1
+                # gap >= 0x8000 is either a late frame or a transmitter reset, resync
+            self._last_seq = seq
+
+        if self._last_arrival is not None:
+            interval = (now - self._last_arrival) * 1000
+            if self._last_interval is not None:
+                self.jitter_ms += (abs(interval - self._last_interval) - self.jitter_ms) / 16
+            self.interval_ms += (interval - self.interval_ms) / 16 if self.interval_ms else interval
+            self._last_interval = interval
+        self._last_arrival = now
+
+        self._push(now, 1, lost, 0, payload_bytes)
+        self.total_received += 1
+        self.total_lost += lost
+        return True
+
+    def _push(self, now: float, received: int, lost: int, crc_errors: int, payload_bytes: int):
+        self._events.append((now, received, lost, crc_errors, payload_bytes))
+        self._received += received
+        self._lost += lost
+        self._crc_errors += crc_errors
+        self._bytes += payload_bytes
+        self._expire(now)
+
+    def _expire(self, now: float):
+        limit = now - self.window_seconds
+        events = self._events
+        while events and events[0][0] < limit:
+            _, received, lost, crc_errors, payload_bytes = events.popleft()
+            self._received -= received
+            self._lost -= lost
+            self._crc_errors -= crc_errors
+            self._bytes -= payload_bytes
+
+    def snapshot(self, now: float | None = None) -> Dict[str, Any]:
+        """ Current link health, broadcast on its own timer """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+
+        # Frames that should have arrived since the last one, not confirmed yet
+        age_ms = (now - self._last_arrival) * 1000 if self._last_arrival is not None else None
+        pending = 0
+        if age_ms is not None and self.interval_ms:
+            pending = max(int(age_ms / self.interval_ms) - 1, 0)
+
+        expected = self._received + self._lost + pending
+        frames = self._received + self._crc_errors
+        # Throughput over the covered part of the window, not the whole window at startup
+        span = min(self.window_seconds, now - self._events[0][0]) if self._events else 0
+        span = max(span, 1.0)
+        return {
+            "packet_loss_pct": 100 * (self._lost + pending) / expected if expected else 0.0,
+            "crc_error_pct": 100 * self._crc_errors / frames if frames else 0.0,
+            "jitter_ms": self.jitter_ms,
+            "interval_ms": self.interval_ms,
+            "packets_per_s": self._received / span,
+            "throughput_bps": 8 * self._bytes / span,
+            "received": self.total_received,
+            "lost": self.total_lost,
+            "pending_lost": pending,
+            "crc_errors": self.total_crc_errors,
+            "last_frame_age_ms": age_ms,
+        }
@@ -0,0 +1,127 @@
+"""
+    Multi-resolution rollups of the telemetry stream.
+
+    Every level keeps its open bucket in memory and only emits it once a
+    sample lands outside of it, so the aggregates are maintained while the
+    data arrives instead of being recomputed from the raw rows.
+"""
+
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Bucket widths in milliseconds, finest first
+ROLLUP_LEVELS_MS = (100, 1000, 10000, 60000)
+
+# (resolution_ms, bucket_start, channel, min, max, mean, last, count)
+RollupRow = Tuple[int, int, str, float, float, float, float, int]
+
+def pick_level(resolution_ms: float, levels: Iterable[int] = ROLLUP_LEVELS_MS) -> int | None:
+    """
+    Returns the coarsest level that still meets the requested resolution.
+    None means that only the raw data is fine enough.
+    """
+    chosen = None
+    for level in sorted(levels):
+        if level <= resolution_ms:
+            chosen = level
+    return chosen
+
+def fit_level(span_ms: float, max_points: int, levels: Iterable[int] = ROLLUP_LEVELS_MS) -> int:
+    """
+    Returns the finest level whose buckets over span_ms fit in max_points,
+    or the coarsest level when none does.
+    A range covers one bucket more than span / level, it rarely starts on a boundary.
+    """
+    levels = sorted(levels)
+    for level in levels:
+        if -(-span_ms // level) + 1 <= max_points:
+            return level
+    return levels[-1]
+
+class RollupAggregator:
+    """
+    Keeps min/max/mean/last per channel for each rollup level.
+    Channels in last_only only keep their last value.
+    """
+    def __init__(self, channels: Iterable[str], levels: Iterable[int] = ROLLUP_LEVELS_MS,
+                 last_only: Iterable[str] = ()):
+        self.channels = tuple(channels)
+        self.levels = tuple(sorted(levels))
+        self.last_only = frozenset(last_only)
+        self._bucket_start: Dict[int, int | None] = {level: None for level in self.levels}
+        # channel -> [min, max, sum, count, last]
+        self._stats: Dict[int, Dict[str, list]] = {level: {} for level in self.levels}
+
+    def add(self, timestamp: int, packet: Dict[str, Any]) -> List[RollupRow]:
+        """
+        Adds a sample to every level.
+        Returns the rows of the buckets that were closed by this sample.
+        """
+        closed = []
+        timestamp = int(timestamp)
+        for level in self.levels:
+            bucket = timestamp - timestamp % level
+            if self._bucket_start[level] != bucket:
+                closed.extend(self._emit(level))
+                self._bucket_start[level] = bucket
+
+            stats = self._stats[level]
+            for channel in self.channels:
+                value = packet.get(channel)
+                if value is None:
+                    continue
+                s = stats.get(channel)
+                if s is None:
+                    if channel in self.last_only:
+                        stats[channel] = [None, None, None, 1, value]
+                    else:
+                        stats[channel] = [value, value, value, 1, value]
+                    continue
+                if s[2] is None:
+                    s[3] += 1
+                    s[4] = value
+                    continue
+                if value < s[0]:
+                    s[0] = value
+                if value > s[1]:
+                    s[1] = value
+                s[2] += value
+                s[3] += 1
+                s[4] = value
+        return closed
+
+    def snapshot(self, level: int) -> List[RollupRow]:
+        """ Returns the rows of the still open bucket without closing it """
+        start = self._bucket_start.get(level)
+        if start is None:
+            return []
+        return self._rows(level, start)
+
+    def flush(self) -> List[RollupRow]:
+        """ Closes every open bucket, used when a session ends """
+        rows = []
+        for level in self.levels:
+            rows.extend(self._emit(level))
+            self._bucket_start[level] = None
+        return rows
+
+    def pick_level(self, resolution_ms: float) -> int | None:
+        return pick_level(resolution_ms, self.levels)
+
+    def fit_level(self, span_ms: float, max_points: int) -> int:
+        return fit_level(span_ms, max_points, self.levels)
+
+    def _emit(self, level: int) -> List[RollupRow]:
+        start = self._bucket_start[level]
+        if start is None:
+            return []
+        rows = self._rows(level, start)
+        self._stats[level] = {}
+        return rows
+
+    def _rows(self, level: int, start: int) -> List[RollupRow]:
+        # list() copies the items atomically, readers may call snapshot()
+        # from another thread while the ingest keeps adding samples
+        return [
+            (level, start, channel, s[0], s[1], None if s[2] is None else s[2] / s[3], s[4], s[3])
+            for channel, s in list(self._stats[level].items())
+        ]
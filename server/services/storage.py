@@ -0,0 +1,100 @@
+"""
+    Storage backend interface.
+
+    The ingest loop only talks to this interface, so the telemetry can be
+    stored in SQLite or in a time-series database without touching main.py.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Telemetry columns, in the order they are stored
+TELEMETRY_CHANNELS = (
+    "acc_x", "acc_y", "acc_z", "dps_x", "dps_y", "dps_z",
+    "roll", "pitch", "rpm", "speed", "temperature", "soc", "temp_cvt",
+    "volt", "current", "flags", "latitude", "longitude", "timestamp",
+)
+
+# Channels that can be read back by range queries
+DATA_CHANNELS = tuple(c for c in TELEMETRY_CHANNELS if c != "timestamp")
+
+# Bitfields and positions, min/max/mean of them mean nothing so only the
+# last value of each bucket is kept
+LAST_ONLY_CHANNELS = ("flags", "latitude", "longitude")
+
+class StorageBackend(ABC):
+    """
+    Sessions, bulk writes and range reads of the telemetry data.
+    """
+    session_id = None
+    # Time columns returned by the reads. "timestamp" is the time base of
+    # start/end, the ECU counter unless the backend says otherwise
+    time_channels = ("timestamp",)
+
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """ True once connect() succeeded and until close() """
+
+    @abstractmethod
+    def connect(self):
+        ...
+
+    @abstractmethod
+    def close(self):
+        ...
+
+    def create_schema(self):
+        """ Backends without a schema don't need to do anything """
+
+    def status(self) -> Dict[str, Any]:
+        """ Health of the backend, e.g. writes waiting to be delivered """
+        return {"backend": type(self).__name__, "connected": self.is_connected}
+
+    @abstractmethod
+    def start_new_session(self, label: str = "Default Session"):
+        ...
+
+    def save_telemetry_data(self, packet: Dict[str, Any]):
+        """ Saves a single telemetry packet """
+        self.save_telemetry_batch([packet])
+
+    @abstractmethod
+    def save_telemetry_batch(self, packets: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def get_session_span(self, session_id: int) -> Tuple[int, int] | None:
+        """ Returns (first, last) timestamp of a session, or None if it is empty """
+
+    @abstractmethod
+    def query_telemetry(self, session_id: int, start: int, end: int,
+                        resolution_ms: float, channels: Iterable[str] | None = None,
+                        max_points: int | None = None):
+        """
+        Reads a time range of a session at the coarsest resolution that still
+        meets resolution_ms. When that would return more than max_points
+        points, the finest rollup level that fits is used instead.
+        Returns (resolution_ms, points), resolution 0 means raw samples.
+        Blocking, call it off the event loop.
+        """
+
+    @abstractmethod
+    def reader_config(self) -> Tuple[type, Dict[str, Any]]:
+        """
+        Returns (class, kwargs) to build a reader of the same storage in
+        another process, the backend itself holds connections and threads.
+        """
+
+    def count_session(self, session_id: int) -> int | None:
+        """ Number of samples of a session, for progress reports. None if unknown """
+        return None
+
+    @abstractmethod
+    def iter_session(self, session_id: int, channels: Iterable[str],
+                     start: int | None = None, end: int | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the raw samples of a session ordered by timestamp, optionally
+        limited to [start, end].
+        Works without connect(), it opens its own read connection.
+        """
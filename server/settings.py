@@ -21,10 +21,29 @@ class Settings(BaseSettings):
     serial_port: str = "/dev/pts/4" # Change to your actual port
     serial_baudrate: int = 115200
     serial_packet_format: str = "<fBBfBHhhhhhh hhH BddI" # Always check
+    serial_sequence_numbers: bool = False # Frame carries a uint16 sequence number before the payload
+    serial_crc16: bool = False # Frame ends with a CRC-16/CCITT-FALSE of sequence number and payload
+    link_window_seconds: float = 10.0 # Window of the link quality statistics
+    link_broadcast_interval_seconds: float = 1.0 # Link health is sent on its own timer, even with no packets
 
     # Database Settings
+    storage_backend: Literal["sqlite", "influxdb"] = "sqlite"
     database_path: str = "./data/database/database.db"
 
+    # InfluxDB Settings (storage_backend = "influxdb")
+    influx_url: str = "http://localhost:8086"
+    influx_token: str = ""
+    influx_org: str = "mangue"
+    influx_bucket: str = "telemetry"
+    influx_batch_size: int = 500
+    influx_flush_interval_seconds: float = 1.0
+    influx_max_retries: int = 3
+    influx_spill_path: str = "./data/influx_spill"
+
+    # Analytics Settings
+    analytics_workers: int = 2
+    analytics_cache_size: int = 32
+
 # Exports the settings
 # Single customized settings entity
 settings = Settings()
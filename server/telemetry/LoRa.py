@@ -5,18 +5,27 @@ import struct
 from collections import deque
 import logging # Use the logging module
 
+from services.link_quality import LinkQualityMonitor, crc16_ccitt
+
 logger = logging.getLogger(__name__)
 
 class SerialTelemetry:
     """
     Handles receiving telemetry data from a serial port using a robust queue.
     """
-    def __init__(self, port: str, baudrate: int, packet_format: str):
+    def __init__(self, port: str, baudrate: int, packet_format: str,
+                 sequence_numbers: bool = False, crc16: bool = False,
+                 link_window_seconds: float = 10.0):
         self.port = port
         self.baudrate = baudrate
         self.packet_format = packet_format
         self.packet_size = struct.calcsize(self.packet_format)
         self.start_marker = b'\xaa\xbb\xcc\xdd'
+        # Optional framing: marker + [seq uint16] + payload + [crc16 of seq and payload]
+        self.sequence_numbers = sequence_numbers
+        self.crc16 = crc16
+        self.frame_size = self.packet_size + (2 if sequence_numbers else 0) + (2 if crc16 else 0)
+        self.link_quality = LinkQualityMonitor(window_seconds=link_window_seconds)
         self._task = None
         self.ser = None
         self.queue = asyncio.Queue(maxsize=10)
@@ -56,11 +65,14 @@ class SerialTelemetry:
                 buffer.append(byte)
 
                 if b"".join(buffer) == self.start_marker:
-                    payload = await loop.run_in_executor(
-                        None, self.ser.read, self.packet_size
+                    frame = await loop.run_in_executor(
+                        None, self.ser.read, self.frame_size
                     )
                     
-                    if len(payload) == self.packet_size:
+                    if len(frame) == self.frame_size:
+                        payload = self._unframe(frame)
+                        if payload is None:
+                            continue
                         logger.info(f"[Serial] Pacote completo recebido ({self.packet_size} bytes)")
                         if self.queue.full():
                             await self.queue.get() # Discard oldest if full
@@ -70,6 +82,29 @@ class SerialTelemetry:
                 logger.error(f"[Serial] Erro durante a leitura: {e}", exc_info=True)
                 break
 
+    def _unframe(self, frame: bytes) -> bytes | None:
+        """
+        Checks the CRC and sequence number of a frame and accounts it in the
+        link statistics. Returns the payload, or None if the frame is corrupted
+        or a retransmission of the previous one.
+        """
+        if self.crc16:
+            body, (crc,) = frame[:-2], struct.unpack("<H", frame[-2:])
+            if crc16_ccitt(body) != crc:
+                self.link_quality.on_frame(len(body), crc_ok=False)
+                logger.debug("[Serial] Pacote descartado: CRC inválido")
+                return None
+            frame = body
+
+        seq = None
+        if self.sequence_numbers:
+            (seq,), frame = struct.unpack("<H", frame[:2]), frame[2:]
+
+        if not self.link_quality.on_frame(len(frame), seq=seq):
+            logger.debug("[Serial] Pacote descartado: duplicado")
+            return None
+        return frame
+
     async def get_payload(self) -> bytes:
         """Returns the latest data packet from the queue."""
         return await self.queue.get()
@@ -0,0 +1,68 @@
+"""
+    SQLite backend range queries over the rollup levels.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.database import DatabaseService
+
+class DatabaseQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = DatabaseService(db_path=os.path.join(self.path, "database.db"))
+        self.db.connect()
+        self.db.create_schema()
+        self.db.start_new_session("Test")
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.path)
+
+    def save(self, seconds: int, hz: int):
+        step = 1000 // hz
+        self.db.save_telemetry_batch([
+            {"rpm": 3000 + t % 1000, "speed": 10.0, "timestamp": t}
+            for t in range(0, seconds * 1000, step)
+        ])
+
+    def test_raw_range_over_max_points_reaches_end(self):
+        # 150 s at 20 Hz, the derived resolution (75 ms) is below the finest level
+        self.save(150, 20)
+        start, end, max_points = 0, 149950, 2000
+        level, points = self.db.query_telemetry(self.db.session_id, start, end,
+                                                (end - start) / max_points, ["rpm"],
+                                                max_points=max_points)
+
+        self.assertEqual(level, 100)
+        self.assertLessEqual(len(points), max_points)
+        self.assertGreater(points[-1]["timestamp"] + level, end)
+
+    def test_raw_range_within_max_points(self):
+        self.save(10, 20)
+        level, points = self.db.query_telemetry(self.db.session_id, 0, 9950, 5, ["rpm"],
+                                                max_points=2000)
+
+        self.assertEqual(level, 0)
+        self.assertEqual(len(points), 200)
+        self.assertEqual(points[-1]["timestamp"], 9950)
+
+    def test_rollup_level_fits_max_points(self):
+        # 3 h at 1 Hz, 5400 ms per point would pick the 1 s level
+        self.save(3 * 3600, 1)
+        start, end, max_points = 0, 3 * 3600 * 1000, 2000
+        level, points = self.db.query_telemetry(self.db.session_id, start, end,
+                                                (end - start) / max_points, ["rpm"],
+                                                max_points=max_points)
+
+        self.assertEqual(level, 10000)
+        self.assertLessEqual(len(points), max_points)
+        self.assertGreater(points[-1]["timestamp"] + level, end - 1000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+    InfluxDB backend against a local HTTP stand-in of the v2 write and query API.
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.influx import InfluxLineProtocolBackend
+
+class _StandIn(BaseHTTPRequestHandler):
+    """
+    Answers writes with the next status of the server's queue, 204 when empty.
+    Queries get the server's CSV response and keep their Flux.
+    """
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.startswith("/api/v2/query"):
+            self.server.queries.append(body.decode())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.end_headers()
+            self.wfile.write(self.server.csv.encode())
+            return
+        status = self.server.statuses.pop(0) if self.server.statuses else 204
+        if status == 204:
+            self.server.lines.extend(gzip.decompress(body).decode().split("\n"))
+        self.server.requests.append((self.path, self.headers.get("Content-Encoding")))
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class InfluxBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), _StandIn)
+        self.server.statuses = []
+        self.server.lines = []
+        self.server.requests = []
+        self.server.queries = []
+        self.server.csv = ""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.spill_path = tempfile.mkdtemp()
+        # No writer thread, the tests call flush() themselves
+        self.backend = InfluxLineProtocolBackend(
+            url=f"http://127.0.0.1:{self.server.server_port}",
+            token="token", org="org", bucket="bucket",
+            max_retries=0, spill_path=self.spill_path,
+        )
+        self.backend.start_new_session("Test")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.spill_path)
+
+    def spilled(self, *subdir):
+        path = os.path.join(self.spill_path, *subdir)
+        return [n for n in os.listdir(path) if n.endswith(".lp.gz")] if os.path.isdir(path) else []
+
+    def test_write(self):
+        before = time.time_ns()
+        self.backend.save_telemetry_batch([{"rpm": 3000, "speed": 12.5, "timestamp": 1000}])
+        self.backend.flush()
+
+        path, encoding = self.server.requests[0]
+        self.assertIn("/api/v2/write?", path)
+        self.assertIn("precision=ns", path)
+        self.assertEqual(encoding, "gzip")
+
+        line = self.server.lines[-1]
+        self.assertTrue(line.startswith(f"telemetry,session={self.backend.session_id} "))
+        self.assertIn("rpm=3000.0", line)
+        self.assertIn("ecu_timestamp=1000i", line)
+        # Stamped with the receive time, not the ECU counter
+        self.assertGreaterEqual(int(line.rsplit(" ", 1)[1]), before)
+
+    def test_spill_and_replay(self):
+        self.server.statuses = [503]
+        self.backend.save_telemetry_batch([{"rpm": 1, "timestamp": 1}])
+        self.backend.flush()
+        self.assertEqual(len(self.spilled()), 1)
+        self.assertEqual(self.server.lines, [])
+
+        # Back online, the spilled batch goes before the new data
+        self.backend.save_telemetry_batch([{"rpm": 2, "timestamp": 2}])
+        self.backend.flush()
+        self.assertEqual(self.spilled(), [])
+        rpm_lines = [line for line in self.server.lines if line.startswith("telemetry")]
+        self.assertEqual(len(rpm_lines), 2)
+        self.assertIn("rpm=1.0", rpm_lines[0])
+        self.assertIn("rpm=2.0", rpm_lines[1])
+
+    def test_rejected_batches_are_kept(self):
+        self.server.statuses = [422]
+        self.backend.save_telemetry_batch([{"rpm": 1, "timestamp": 1}])
+        self.backend.flush()
+
+        self.assertEqual(self.backend.rejected_batches, 1)
+        self.assertEqual(len(self.spilled("rejected")), 1)
+        self.assertEqual(self.backend.status()["rejected_batches"], 1)
+
+        # Not replayed with the retryable spill queue
+        self.backend.flush()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_iter_session_streams_pivoted_rows(self):
+        self.server.csv = (
+            "#datatype,string,long,dateTime:RFC3339,long,double,double\r\n"
+            ",result,table,_time,ecu_timestamp,rpm,speed\r\n"
+            ",_result,0,1970-01-01T00:00:01Z,50,3000,12.5\r\n"
+            ",_result,0,1970-01-01T00:00:02Z,100,3100,\r\n"
+            "\r\n"
+        )
+        channels = [*self.backend.time_channels, "rpm", "speed"]
+        rows = list(self.backend.iter_session(1, channels, start=1000, end=2000))
+
+        self.assertEqual(rows, [
+            {"timestamp": 1000, "ecu_timestamp": 50, "rpm": 3000.0, "speed": 12.5},
+            {"timestamp": 2000, "ecu_timestamp": 100, "rpm": 3100.0, "speed": None},
+        ])
+        self.assertIn('"ecu_timestamp"', self.server.queries[0])
+        self.assertIn("pivot(", self.server.queries[0])
+        self.assertIn('sort(columns: ["_time"])', self.server.queries[0])
+
+if __name__ == "__main__":
+    unittest.main()